@@ -1,89 +1,337 @@
-import json
+import asyncio
+import atexit
+import hashlib
+import orjson
 import os
 import anthropic
-import re
 import pandas as pd
+import string
+import threading
 import streamlit as st
 from dotenv import load_dotenv
-import plotly.graph_objs as go
-import streamlit.components.v1 as components
-import statistics
 
+# Static prompt skeletons; only the $placeholders are filled in per click
+PROJECTION_TMPL = string.Template("""
+Generate a financial projection as valid JSON with exactly this structure:
+{
+    "explanation": "text with the four sections listed below",
+    "chart": {
+        "data": {
+            "years": [1,2,3,4,5,6,7,8,9,10,11,12,13,14,15],
+            "netWorth": [list of 15 numbers],
+            "income": [list of 15 numbers],
+            "expenses": [list of 15 numbers],
+            "loans": [list of 15 numbers]
+        },
+        "summary": {
+            "totalNetWorth": number,
+            "peakNetWorth": number,
+            "averageGrowth": number
+        }
+    },
+    "plans": [list of 3 strings]
+}
+
+The "explanation" value must contain these exact sections:
+
+1. EDUCATION COSTS
+- Institution: $institution
+- Program: $field
+- Residency Status: [determine if $zipcode is in-state or out-of-state for $institution]
+- Annual tuition: [exact number]
+- Living costs during school: [exact number]
+- Total 4-year cost: [exact number]
+
+2. FINANCIAL AID
+- Zipcode $zipcode median household income: [exact number]
+- Expected grants: [exact number]
+- Loan amount needed: [exact number]
+- Monthly loan payment: [exact number]
+
+3. CAREER PROJECTION
+- Position: $occupation
+- Location: $area
+- Starting salary: [exact number]
+- Expected annual raises: [percentage]
+- Housing ($house bedroom) monthly cost: [exact number]
+
+4. YEARLY BREAKDOWN
+Year 1-4 (School):
+- Annual expenses: [exact number]
+- Loan accumulation: [exact number]
+- Net worth change: [exact number]
+
+Years 5-15 (Career):
+- Annual income: [exact number]
+- Annual expenses: [exact number]
+- Loan payments: [exact number]
+- Savings rate: [exact number]
+- Net worth change: [exact number]
+
+Provide all numbers as plain numbers without currency symbols or commas.
+Do not include any explanatory text between sections.
+Each number should be a specific value, not a range.
+
+The "chart" value must follow these rules:
+- All numbers should be integers or decimals without commas
+- First 4 years should show school expenses and loan accumulation
+- Years 5-15 should show career income and expenses
+- Use the numbers from the explanation for calculations
+
+The "plans" value must contain 3 alternative plans for the user:
+alternative college, field of study, career, and location recommended. Provide them in concise text.
+
+Return only the JSON object, no additional text.
+""")
+
+ADDITIONAL_TMPL = string.Template("""
+Considering these personal preferences or interests:
+$context
+
+Generate a financial projection as valid JSON with exactly this structure:
+{
+    "data": {
+        "years": [1,2,3,4,5,6,7,8,9,10,11,12,13,14,15],
+        "netWorth": [list of 15 numbers showing significant changes based on preferences],
+        "income": [list of 15 numbers showing significant changes based on preferences],
+        "expenses": [list of 15 numbers showing significant changes based on preferences],
+        "loans": [list of 15 numbers showing significant changes based on preferences]
+    },
+    "summary": {
+        "totalNetWorth": number,
+        "peakNetWorth": number,
+    },
+    "impact": {
+        "changes": [list of specific changes based on preferences],
+        "financialEffect": [list of financial impacts]
+    }
+}
+
+Based on the original projection, ensure that the changes reflected are meaningful and align with the preferences. 
+Additionally, compare these changes to ensure they differ from the previous projections below:
+$explanation
+""")
+
+REVISED_PLAN_TMPL = string.Template("""
+Considering these personal preferences or interests:
+$context
+
+Based on the explanation below, provide 3 alternative plans for the user that fit these preferences:
+alternative college, field of study, career, and location recommended. Provide them in concise text.
+
+Explanation:
+$explanation
+""")
+
+TRANSITION_TMPL = string.Template("""
+Generate a financial projection showing impact of career/education change
+make sure new path shows the negative or positive impact on the net worth and other financial metrics:
+Original Path (Years 1-$last_original_year):
+- Institution: $institution
+- Field: $field
+- Location: $area
+- Occupation: $occupation
+
+New Path (Years $transition_year-15):
+- Institution: $new_institution
+- Field: $new_field
+- Location: $new_area
+- Occupation: $new_occupation
+
+Return valid JSON with structure:
+{
+    "data": {
+        "years": [1-15],
+        "netWorth": [15 numbers],
+        "income": [15 numbers],
+        "expenses": [15 numbers],
+        "loans": [15 numbers]
+    },
+    "summary": {
+        "totalNetWorth": number,
+        "peakNetWorth": number,
+        "averageGrowth": number,
+        "transitionCost": number
+    },
+    "impact": {
+        "changes": [strings],
+        "financialEffect": [strings]
+    }
+}
+""")
+
+# (question, variable name, widget) for each personalisation step
+_ADDITIONAL = [
+    ("Do you have a pet? If yes, what kind?", "pet", st.text_input),
+    ("What is your favorite subject?", "subject", st.text_input),
+    ("What is your main goal in life?", "goal", st.text_input),
+    ("Do you like money?", "like_money", st.checkbox),
+    ("Do you have any hobbies? If so, what kind?", "hobbies", st.text_input),
+    ("Do you like cars?", "like_cars", st.checkbox),
+    ("Do you admire any singer? If yes, who?", "admire_singer", st.text_input)
+]
+
+@st.cache_data(show_spinner=False)
 def load_data():
-    df_edu = pd.read_csv('california_colleges.csv')
-    df_occ = pd.read_csv('msa_occ_wage_only_3columns.csv')
-    
-    df_edu['INSTNM'] = df_edu['INSTNM'].str.strip()
-    df_edu['CIPDESC'] = df_edu['CIPDESC'].str.strip()
-    
-    return df_edu, df_occ
+    # Built from the CSVs by convert_to_parquet.py: already stripped, categorical
+    # and with A_MEAN numeric, so there is nothing left to parse or clean here
+    df_edu = pd.read_parquet('california_colleges.parquet', columns=['INSTNM', 'CIPDESC'])
+    df_occ = pd.read_parquet(
+        'msa_occ_wage_only_3columns.parquet',
+        columns=['AREA_TITLE', 'OCC_TITLE', 'A_MEAN']
+    )
+
+    # Lookup tables so widget changes are dict hits instead of full-frame masks.
+    # Plain tuples, since each Categorical from unique() drags every category along
+    # when cache_data copies the result
+    inst_to_fields = {
+        inst: tuple(fields)
+        for inst, fields in df_edu.groupby('INSTNM', sort=False, observed=True)['CIPDESC'].unique().items()
+    }
+    area_to_occ = {
+        area: tuple(occs)
+        for area, occs in df_occ.groupby('AREA_TITLE', sort=False, observed=True)['OCC_TITLE'].unique().items()
+    }
 
-def query_claude_3_5(prompt, api_key):
-    try:
-        client = anthropic.Anthropic(api_key=api_key)
-        message = client.messages.create(
-            model="claude-3-5-sonnet-20241022",
-            max_tokens=1000,
-            temperature=0.5,
-            messages=[{"role": "user", "content": prompt}]
+    # Sorted once here so the selectbox options are stable and never rebuilt per rerun
+    institutions = tuple(sorted(inst_to_fields))
+    areas = tuple(sorted(area_to_occ))
+    salary_lookup = format_salary_series(
+        df_occ.drop_duplicates(['AREA_TITLE', 'OCC_TITLE'])
+        .set_index(['AREA_TITLE', 'OCC_TITLE'])['A_MEAN']
+    ).to_dict()
+
+    # main() only needs the lookups, and cache_data copies whatever is returned on
+    # every rerun, so the frames themselves stay inside the loader
+    return institutions, areas, inst_to_fields, area_to_occ, salary_lookup
+
+@st.cache_resource
+def get_anthropic_client(api_key):
+    return anthropic.Anthropic(api_key=api_key)
+
+# Keyed on prompt, model and max_tokens; the leading underscore keeps the API key out of the hash.
+# Failed calls raise, so errors are never cached.
+@st.cache_data(show_spinner=False, ttl=3600, max_entries=256)
+def cached_claude(prompt, model, _api_key, max_tokens=1000):
+    client = get_anthropic_client(_api_key)
+    message = client.messages.create(
+        model=model,
+        max_tokens=max_tokens,
+        temperature=0.5,
+        messages=[{"role": "user", "content": prompt}]
+    )
+    return message.content[0].text
+
+CLAUDE_MODEL = "claude-3-5-sonnet-20241022"
+
+# Connection errors, timeouts (408), rate limits (429), server errors and overloaded (529)
+# are worth another attempt; anything else (bad request, auth) fails straight away
+def is_retryable(error):
+    if isinstance(error, anthropic.APIConnectionError):
+        return True
+    return isinstance(error, anthropic.APIStatusError) and (
+        error.status_code in (408, 429) or error.status_code >= 500
+    )
+
+# A single long-lived loop, so the async client's connection pool isn't thrown away
+# with each asyncio.run loop and later calls skip the TCP/TLS handshake
+@st.cache_resource
+def get_event_loop():
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    return loop
+
+@st.cache_resource
+def get_async_client(api_key):
+    # Retries are handled in fan_out so the backoff schedule is explicit
+    return anthropic.AsyncAnthropic(api_key=api_key, max_retries=0)
+
+async def fan_out(prompts, client, max_tokens=1000, max_concurrency=5, attempts=3):
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def run(prompt):
+        async with semaphore:
+            for attempt in range(attempts):
+                try:
+                    message = await client.messages.create(
+                        model=CLAUDE_MODEL,
+                        max_tokens=max_tokens,
+                        temperature=0.5,
+                        messages=[{"role": "user", "content": prompt}]
+                    )
+                    return message.content[0].text
+                except anthropic.APIError as e:
+                    if attempt == attempts - 1 or not is_retryable(e):
+                        raise
+                    await asyncio.sleep(2 ** attempt)
+
+    # One failed prompt shouldn't throw away the others that succeeded
+    return await asyncio.gather(*(run(prompt) for prompt in prompts), return_exceptions=True)
+
+FAN_OUT_TIMEOUT = 120
+
+def query_claude_many(prompts, api_key, max_tokens=1000):
+    """Send independent prompts concurrently; wall time is the slowest call, not the sum"""
+    # The async path bypasses st.cache_data, so completions are memoized per session
+    cache = st.session_state.setdefault("_llm_cache", {})
+    keys = [
+        f"{hashlib.sha256(prompt.encode()).hexdigest()}:{CLAUDE_MODEL}:{max_tokens}"
+        for prompt in prompts
+    ]
+    missing = [(key, prompt) for key, prompt in zip(keys, prompts) if key not in cache]
+
+    if missing:
+        future = asyncio.run_coroutine_threadsafe(
+            fan_out(
+                [prompt for _, prompt in missing],
+                get_async_client(api_key),
+                max_tokens,
+                # Set to what the account's rate limit allows
+                max_concurrency=int(os.getenv("ANTHROPIC_MAX_CONCURRENCY", "5"))
+            ),
+            get_event_loop()
         )
-        return message.content[0].text
+        try:
+            results = future.result(timeout=FAN_OUT_TIMEOUT)
+        except Exception as e:
+            future.cancel()
+            st.error(f"API call failed: {e!r}")
+            return [cache.get(key) for key in keys]
+        for (key, _), result in zip(missing, results):
+            if isinstance(result, Exception):
+                st.error(f"API call failed: {result}")
+            else:
+                cache[key] = result
+
+    return [cache.get(key) for key in keys]
+
+def query_claude_3_5(prompt, api_key, max_tokens=1000):
+    try:
+        return cached_claude(prompt, CLAUDE_MODEL, api_key, max_tokens)
     except Exception as e:
         st.error(f"API call failed: {e}")
         return None
 
-def format_salary(salary):
-    try:
-        return "${:,.2f}".format(float(salary))
-    except (ValueError, TypeError):
-        return "N/A"
+def format_salary_series(salaries):
+    return salaries.map("${:,.2f}".format, na_action='ignore').fillna("N/A")
+
+# One append handle per file for the whole process instead of reopening it per save.
+# Every session writes through it, so writes take the lock and are flushed right away
+@st.cache_resource
+def get_output_handle(filename):
+    handle = open(filename, "a")
+    atexit.register(handle.close)
+    return handle, threading.Lock()
 
 def save_output_to_file(output, filename="output.txt"):
     if not output:
         print("No output to save.")
         return
         
-    with open(filename, "a") as file:
-        file.write(output + "\n")
-
-def validate_json_structure(data):
-    required_keys = {
-        "revisedExplanation": {
-            "1. EDUCATION COSTS",
-            "2. FINANCIAL AID", 
-            "3. CAREER PROJECTION",
-            "4. YEARLY BREAKDOWN"
-        },
-        "comparison": {
-            "mainChanges",
-            "financialImpact"
-        }
-    }
-    
-    if not all(key in data for key in required_keys):
-        return False
-    return True
-
-def format_revised_projection(original_data, revised_data):
-    if not validate_json_structure(revised_data):
-        raise ValueError("Invalid revised projection structure")
-        
-    try:
-        return {
-            "data": {
-                "years": list(range(1, 16)),
-                "netWorth": revised_data["4. YEARLY BREAKDOWN"]["netWorthProgression"],
-                "income": revised_data["4. YEARLY BREAKDOWN"]["incomeProgression"],
-                "expenses": revised_data["4. YEARLY BREAKDOWN"]["expenseProgression"]
-            },
-            "summary": {
-                "totalNetWorth": revised_data["4. YEARLY BREAKDOWN"]["totalNetWorth"],
-                "peakNetWorth": revised_data["4. YEARLY BREAKDOWN"]["peakNetWorth"],
-                "averageGrowth": revised_data["4. YEARLY BREAKDOWN"]["averageGrowth"]
-            }
-        }
-    except KeyError as e:
-        raise KeyError(f"Missing required key in revised projection: {e}")
+    handle, lock = get_output_handle(filename)
+    with lock:
+        handle.write(output + "\n")
+        handle.flush()
 
 def validate_projection_data(original_data, revised_data, transition_year):
     """Validate that projection data is consistent"""
@@ -98,6 +346,51 @@ def validate_projection_data(original_data, revised_data, transition_year):
     return True
 
 
+# Tuples keep the arguments hashable, so identical chart data reuses the built figure
+@st.cache_data(show_spinner=False)
+def build_projection_fig(years, net_worth, income, expenses):
+    # Deferred so the landing page doesn't pay for importing plotly
+    import plotly.graph_objs as go
+
+    fig = go.Figure()
+
+    # Net Worth line
+    fig.add_trace(go.Scatter(
+        x=years,
+        y=net_worth,
+        name="Net Worth",
+        mode="lines+markers",
+        line=dict(color="green", width=3)
+    ))
+
+    # Income and Expenses bars
+    fig.add_trace(go.Bar(
+        x=years,
+        y=income,
+        name="Income",
+        marker_color="blue",
+        opacity=0.6
+    ))
+
+    fig.add_trace(go.Bar(
+        x=years,
+        y=expenses,
+        name="Expenses",
+        marker_color="red",
+        opacity=0.6
+    ))
+
+    fig.update_layout(
+        title="15-Year Financial Projection",
+        xaxis_title="Year",
+        yaxis_title="Amount ($)",
+        barmode="group",
+        template="plotly_white",
+        showlegend=True
+    )
+
+    return fig
+
 def main():
     st.title("15 Year Net Worth Projection")
     load_dotenv()
@@ -106,8 +399,10 @@ def main():
         st.session_state["responses_history"] = []
     if "current_projection" not in st.session_state:
         st.session_state["current_projection"] = None
+    if "context_str" not in st.session_state:
+        st.session_state["context_str"] = ""
 
-    df_edu, df_occ = load_data()
+    institutions, areas, inst_to_fields, area_to_occ, salary_lookup = load_data()
     
     # Only Claude 3.5 in this model selection, but keep design
     llm_models = {
@@ -117,29 +412,35 @@ def main():
     col1, col2, col3 = st.columns([1,2,2])
     
     with col1:
-        selected_model = st.selectbox("Select LLM Model", list(llm_models.keys()))
+        selected_model = st.selectbox("Select LLM Model", list(llm_models.keys()), key="model")
     
     with col2:
-        institution = st.selectbox("Select Institution", df_edu['INSTNM'].unique())
-        fields = df_edu[df_edu['INSTNM'] == institution]['CIPDESC'].unique()
-        field = st.selectbox("Select Field of Study", fields)
+        institution = st.selectbox("Select Institution", institutions, key="institution")
 
     with col3:
-        area = st.selectbox("Select Geographic Area", df_occ['AREA_TITLE'].unique())
-        occupations = df_occ[df_occ['AREA_TITLE'] == area]['OCC_TITLE'].unique()
-        occupation = st.selectbox("Select Occupation", occupations)
-    
-    zipcode = st.text_input("Enter your current ZIP code")
-    house = st.number_input('Do you plan to live alone? How many bedrooms?', min_value=1, step=1)
-    
-    try:
-        salary_info = df_occ[
-            (df_occ['AREA_TITLE'] == area) & 
-            (df_occ['OCC_TITLE'] == occupation)
-        ]['A_MEAN'].iloc[0]
-        formatted_salary = format_salary(salary_info)
-    except IndexError:
-        formatted_salary = "N/A"
+        area = st.selectbox("Select Geographic Area", areas, key="area")
+
+    # Field and occupation options depend on the two selections above, so those
+    # stay outside the form; the rest only rerun the script when submitted
+    with st.form("inputs"):
+        _, form_col2, form_col3 = st.columns([1,2,2])
+
+        with form_col2:
+            fields = inst_to_fields[institution]
+            field = st.selectbox("Select Field of Study", fields, key="field")
+
+        with form_col3:
+            occupations = area_to_occ[area]
+            occupation = st.selectbox("Select Occupation", occupations, key="occupation")
+
+        zipcode = st.text_input("Enter your current ZIP code", key="zipcode")
+        house = st.number_input('Do you plan to live alone? How many bedrooms?', min_value=1, step=1, key="house")
+        submitted = st.form_submit_button("Update")
+
+    if submitted:
+        st.session_state["inputs_submitted"] = True
+    if not st.session_state.get("inputs_submitted"):
+        return
     
     if "explanation_response" not in st.session_state:
         st.session_state["explanation_response"] = ""
@@ -147,128 +448,47 @@ def main():
     if "chart_response" not in st.session_state:
         st.session_state["chart_response"] = ""
 
-    explanation_prompt = f"""
-    Provide a detailed financial projection with these exact sections:
-
-    1. EDUCATION COSTS
-    - Institution: {institution}
-    - Program: {field}
-    - Residency Status: [determine if {zipcode} is in-state or out-of-state for {institution}]
-    - Annual tuition: [exact number]
-    - Living costs during school: [exact number]
-    - Total 4-year cost: [exact number]
-
-    2. FINANCIAL AID
-    - Zipcode {zipcode} median household income: [exact number]
-    - Expected grants: [exact number]
-    - Loan amount needed: [exact number]
-    - Monthly loan payment: [exact number]
-
-    3. CAREER PROJECTION
-    - Position: {occupation}
-    - Location: {area}
-    - Starting salary: [exact number]
-    - Expected annual raises: [percentage]
-    - Housing ({house} bedroom) monthly cost: [exact number]
-
-    4. YEARLY BREAKDOWN
-    Year 1-4 (School):
-    - Annual expenses: [exact number]
-    - Loan accumulation: [exact number]
-    - Net worth change: [exact number]
-
-    Years 5-15 (Career):
-    - Annual income: [exact number]
-    - Annual expenses: [exact number]
-    - Loan payments: [exact number]
-    - Savings rate: [exact number]
-    - Net worth change: [exact number]
-
-    Provide all numbers as plain numbers without currency symbols or commas.
-    Do not include any explanatory text between sections.
-    Each number should be a specific value, not a range.
-    """
+    if "plans" not in st.session_state:
+        st.session_state["plans"] = []
+
+    # A single request returns the explanation, chart data and plans together;
+    # "Show Chart" and "Generate Recommended Plans" only reveal stored results.
+    projection_prompt = PROJECTION_TMPL.substitute(
+        institution=institution,
+        field=field,
+        zipcode=zipcode,
+        occupation=occupation,
+        area=area,
+        house=house
+    )
 
     if st.button("Get Explanation"):
         model_id = llm_models[selected_model]
-        explanation_response = query_claude_3_5(explanation_prompt, api_key)
-        st.session_state["explanation_response"] = explanation_response
-        st.write(explanation_response)
-        save_output_to_file(explanation_response)
-
-    if st.session_state["explanation_response"]:
-        chart_prompt = f"""
-        Generate a financial projection as valid JSON with exactly this structure:
-        {{
-            "data": {{
-                "years": [1,2,3,4,5,6,7,8,9,10,11,12,13,14,15],
-                "netWorth": [list of 15 numbers],
-                "income": [list of 15 numbers],
-                "expenses": [list of 15 numbers],
-                "loans": [list of 15 numbers]
-            }},
-            "summary": {{
-                "totalNetWorth": number,
-                "peakNetWorth": number,
-                "averageGrowth": number
-            }}
-        }}
-
-        Rules:
-        - All numbers should be integers or decimals without commas
-        - First 4 years should show school expenses and loan accumulation
-        - Years 5-15 should show career income and expenses
-        - Use the following data for calculations:
-        {st.session_state["explanation_response"]}
-
-        Return only the JSON object, no additional text.
-        """
+        # cached_claude is keyed on the prompt, so unchanged inputs don't hit the API again
+        projection_response = query_claude_3_5(projection_prompt, api_key, max_tokens=3000)
+        if projection_response:
+            try:
+                projection = orjson.loads(projection_response)
+                st.session_state["explanation_response"] = projection["explanation"]
+                st.session_state["chart_response"] = orjson.dumps(projection["chart"]).decode()
+                st.session_state["plans"] = projection["plans"]
+                st.write(st.session_state["explanation_response"])
+                save_output_to_file(projection_response)
+            except orjson.JSONDecodeError as e:
+                st.error(f"Invalid JSON format: {str(e)}")
+            except KeyError as e:
+                st.error(f"Missing required data: {str(e)}")
 
+    if st.session_state["chart_response"]:
         if st.button("Show Chart"):
-            chart_response = query_claude_3_5(chart_prompt, api_key)
-            st.session_state["chart_response"] = chart_response
-            
             try:
-                data = json.loads(chart_response)
-                years = data["data"]["years"]
-                
-                fig = go.Figure()
-                
-                # Net Worth line
-                fig.add_trace(go.Scatter(
-                    x=years,
-                    y=data["data"]["netWorth"],
-                    name="Net Worth",
-                    mode="lines+markers",
-                    line=dict(color="green", width=3)
-                ))
-                
-                # Income and Expenses bars
-                fig.add_trace(go.Bar(
-                    x=years,
-                    y=data["data"]["income"],
-                    name="Income",
-                    marker_color="blue",
-                    opacity=0.6
-                ))
-                
-                fig.add_trace(go.Bar(
-                    x=years,
-                    y=data["data"]["expenses"],
-                    name="Expenses",
-                    marker_color="red",
-                    opacity=0.6
-                ))
-                
-                fig.update_layout(
-                    title="15-Year Financial Projection",
-                    xaxis_title="Year",
-                    yaxis_title="Amount ($)",
-                    barmode="group",
-                    template="plotly_white",
-                    showlegend=True
+                data = orjson.loads(st.session_state["chart_response"])
+                fig = build_projection_fig(
+                    tuple(data["data"]["years"]),
+                    tuple(data["data"]["netWorth"]),
+                    tuple(data["data"]["income"]),
+                    tuple(data["data"]["expenses"])
                 )
-                
                 st.plotly_chart(fig)
                 
                 # Display metrics
@@ -280,56 +500,29 @@ def main():
                 with col3:
                     st.metric("Average Growth", f"${data['summary']['averageGrowth']:,.0f}")
             
-            except json.JSONDecodeError as e:
+            except orjson.JSONDecodeError as e:
                 st.error(f"Invalid JSON format: {str(e)}")
             except KeyError as e:
                 st.error(f"Missing required data: {str(e)}")
             except Exception as e:
                 st.error(f"Error: {str(e)}")
 
-    if st.session_state["chart_response"]:
-        plan_prompt = f"""
-        Based on the explanation and the JSON chart below, provide 3 alternative plans for the user:
-        alternative college, field of study, career, and location recommended. Provide them in concise text.
-
-        Explanation:
-        {st.session_state["explanation_response"]}
-
-        JSON Chart:
-        {st.session_state["chart_response"]}
-        """
-
         if st.button("Generate Recommended Plans"):
-            model_id = llm_models[selected_model]
-            plan_response = query_claude_3_5(plan_prompt, api_key)
-            st.write(plan_response)
-            save_output_to_file(plan_response)
+            for plan in st.session_state["plans"]:
+                st.write(f"• {plan}")
 
     st.subheader(f"Salary Analysis (using {selected_model})")
 
     if "additional_step" not in st.session_state:
         st.session_state["additional_step"] = 0
 
-    additional_variables = [
-        ("Do you have a pet? If yes, what kind?", "pet"),
-        ("What is your favorite subject?", "subject"),
-        ("What is your main goal in life?", "goal"),
-        ("Do you like money?", "like_money"),
-        ("Do you have any hobbies? If so, what kind?", "hobbies"),
-        ("Do you like cars?", "like_cars"),
-        ("Do you admire any singer? If yes, who?", "admire_singer")
-    ]
-
     if st.button("Next Step"):
         st.session_state["additional_step"] += 1
 
     step = st.session_state["additional_step"]
-    if step > 0 and step <= len(additional_variables):
-        question, var_name = additional_variables[step - 1]
-        if var_name in ["like_money", "like_cars"]:
-            response = st.checkbox(question)
-        else:
-            response = st.text_input(question)
+    if step > 0 and step <= len(_ADDITIONAL):
+        question, var_name, widget = _ADDITIONAL[step - 1]
+        response = widget(question)
 
         if st.button("Revise Projection"):
             # Add current response to history
@@ -338,104 +531,95 @@ def main():
                 "response": response
             })
             
-            # Build cumulative context
-            context = "\n".join([
-                f"- {item['question']}: {item['response']}" 
-                for item in st.session_state["responses_history"]
-            ])
-            
-            additional_prompt = f"""
-            Considering these personal preferences or interests:
-            {context}
+            # History is append-only, so extend the cumulative context by one line
+            st.session_state["context_str"] += f"- {question}: {response}\n"
+            context = st.session_state["context_str"]
             
-            Generate a financial projection as valid JSON with exactly this structure:
-            {{
-                "data": {{
-                    "years": [1,2,3,4,5,6,7,8,9,10,11,12,13,14,15],
-                    "netWorth": [list of 15 numbers showing significant changes based on preferences],
-                    "income": [list of 15 numbers showing significant changes based on preferences],
-                    "expenses": [list of 15 numbers showing significant changes based on preferences],
-                    "loans": [list of 15 numbers showing significant changes based on preferences]
-                }},
-                "summary": {{
-                    "totalNetWorth": number,
-                    "peakNetWorth": number,
-                }},
-                "impact": {{
-                    "changes": [list of specific changes based on preferences],
-                    "financialEffect": [list of financial impacts]
-                }}
-            }}
-
-            Based on the original projection, ensure that the changes reflected are meaningful and align with the preferences. 
-            Additionally, compare these changes to ensure they differ from the previous projections below:
-            {st.session_state["explanation_response"]}
-            """
-
-            revised_response = query_claude_3_5(additional_prompt, api_key)
-            try:
-                revised_data = json.loads(revised_response)
-                original_data = json.loads(st.session_state["chart_response"])
-                years = original_data["data"]["years"]
-                
-                fig = go.Figure()
-                
-                # Original projections (dotted lines)
-                fig.add_trace(go.Scatter(
-                    x=years,
-                    y=original_data["data"]["netWorth"],
-                    name='Revised Net Worth',
-                    line=dict(color='blue', dash='dot')
-                ))
+            additional_prompt = ADDITIONAL_TMPL.substitute(
+                context=context,
+                explanation=st.session_state["explanation_response"]
+            )
+
+            revised_plan_prompt = REVISED_PLAN_TMPL.substitute(
+                context=context,
+                explanation=st.session_state["explanation_response"]
+            )
+
+            # The projection and the plans don't depend on each other, so ask for both at once
+            revised_response, revised_plans = query_claude_many(
+                [additional_prompt, revised_plan_prompt], api_key
+            )
+            if revised_response:
+                try:
+                    revised_data = orjson.loads(revised_response)
+                    original_data = orjson.loads(st.session_state["chart_response"])
+                    years = original_data["data"]["years"]
                 
-                # Revised projections (solid lines)
-                fig.add_trace(go.Scatter(
-                    x=years,
-                    y=revised_data["data"]["netWorth"],
-                    name='Original Net Worth',
-                    line=dict(color='blue')
-                ))
+                    import plotly.graph_objs as go
+
+                    fig = go.Figure()
                 
-                # Add other metrics similarly
-                for metric, color in [("income", "green"), ("expenses", "red")]:
+                    # Original projections (dotted lines)
                     fig.add_trace(go.Scatter(
                         x=years,
-                        y=original_data["data"][metric],
-                        name=f'Revised {metric.title()}',
-                        line=dict(color=color, dash='dot')
+                        y=original_data["data"]["netWorth"],
+                        name='Revised Net Worth',
+                        line=dict(color='blue', dash='dot')
                     ))
+                
+                    # Revised projections (solid lines)
                     fig.add_trace(go.Scatter(
                         x=years,
-                        y=revised_data["data"][metric],
-                        name=f'Original {metric.title()}',
-                        line=dict(color=color)
+                        y=revised_data["data"]["netWorth"],
+                        name='Original Net Worth',
+                        line=dict(color='blue')
                     ))
                 
-                fig.update_layout(
-                    title='15-Year Financial Projection Comparison',
-                    xaxis_title='Years',
-                    yaxis_title='Amount ($)',
-                    showlegend=True
-                )
+                    # Add other metrics similarly
+                    for metric, color in [("income", "green"), ("expenses", "red")]:
+                        fig.add_trace(go.Scatter(
+                            x=years,
+                            y=original_data["data"][metric],
+                            name=f'Revised {metric.title()}',
+                            line=dict(color=color, dash='dot')
+                        ))
+                        fig.add_trace(go.Scatter(
+                            x=years,
+                            y=revised_data["data"][metric],
+                            name=f'Original {metric.title()}',
+                            line=dict(color=color)
+                        ))
                 
-                st.plotly_chart(fig)
+                    fig.update_layout(
+                        title='15-Year Financial Projection Comparison',
+                        xaxis_title='Years',
+                        yaxis_title='Amount ($)',
+                        showlegend=True
+                    )
                 
-                # Show impact analysis
-                st.write("### Impact Analysis")
-                for change, effect in zip(
-                    revised_data["impact"]["changes"], 
-                    revised_data["impact"]["financialEffect"]
-                ):
-                    st.write(f"- **Change**: {change}")
-                    st.write(f"  **Effect**: {effect}")
-                    
-                # Update current projection
-                st.session_state["current_projection"] = revised_data
+                    st.plotly_chart(fig)
                 
-            except json.JSONDecodeError:
-                st.error("Failed to parse the projection data")
-            except Exception as e:
-                st.error(f"An error occurred: {str(e)}")
+                    # Show impact analysis
+                    st.write("### Impact Analysis")
+                    for change, effect in zip(
+                        revised_data["impact"]["changes"], 
+                        revised_data["impact"]["financialEffect"]
+                    ):
+                        st.write(f"- **Change**: {change}")
+                        st.write(f"  **Effect**: {effect}")
+
+                    # Update current projection
+                    st.session_state["current_projection"] = revised_data
+                
+                except orjson.JSONDecodeError:
+                    st.error("Failed to parse the projection data")
+                except Exception as e:
+                    st.error(f"An error occurred: {str(e)}")
+
+            if revised_plans:
+                st.write("### Recommended Plans")
+                st.write(revised_plans)
+                save_output_to_file(revised_plans)
 
         if st.button("Change Career/Education Path"):
             st.session_state.show_transition = True
@@ -449,10 +633,10 @@ def main():
             with col1:
                 new_institution = st.selectbox(
                     "New Institution", 
-                    df_edu['INSTNM'].unique(), 
+                    institutions, 
                     key="new_inst"
                 )
-                new_fields = df_edu[df_edu['INSTNM'] == new_institution]['CIPDESC'].unique()
+                new_fields = inst_to_fields[new_institution]
                 new_field = st.selectbox(
                     "New Field of Study", 
                     new_fields, 
@@ -462,10 +646,10 @@ def main():
             with col2:
                 new_area = st.selectbox(
                     "New Geographic Area", 
-                    df_occ['AREA_TITLE'].unique(), 
+                    areas, 
                     key="new_area"
                 )
-                new_occupations = df_occ[df_occ['AREA_TITLE'] == new_area]['OCC_TITLE'].unique()
+                new_occupations = area_to_occ[new_area]
                 new_occupation = st.selectbox(
                     "New Occupation", 
                     new_occupations, 
@@ -473,47 +657,23 @@ def main():
                 )
 
             if st.button("Calculate Path Change Impact"):
-                transition_prompt = f"""
-                Generate a financial projection showing impact of career/education change
-                make sure new path shows the negative or positive impact on the net worth and other financial metrics:
-                Original Path (Years 1-{transition_year-1}):
-                - Institution: {institution}
-                - Field: {field}
-                - Location: {area}
-                - Occupation: {occupation}
-
-                New Path (Years {transition_year}-15):
-                - Institution: {new_institution}
-                - Field: {new_field}
-                - Location: {new_area}
-                - Occupation: {new_occupation}
-
-                Return valid JSON with structure:
-                {{
-                    "data": {{
-                        "years": [1-15],
-                        "netWorth": [15 numbers],
-                        "income": [15 numbers],
-                        "expenses": [15 numbers],
-                        "loans": [15 numbers]
-                    }},
-                    "summary": {{
-                        "totalNetWorth": number,
-                        "peakNetWorth": number,
-                        "averageGrowth": number,
-                        "transitionCost": number
-                    }},
-                    "impact": {{
-                        "changes": [strings],
-                        "financialEffect": [strings]
-                    }}
-                }}
-                """
+                transition_prompt = TRANSITION_TMPL.substitute(
+                    last_original_year=transition_year - 1,
+                    transition_year=transition_year,
+                    institution=institution,
+                    field=field,
+                    area=area,
+                    occupation=occupation,
+                    new_institution=new_institution,
+                    new_field=new_field,
+                    new_area=new_area,
+                    new_occupation=new_occupation
+                )
                 
                 transition_response = query_claude_3_5(transition_prompt, api_key)
                 try:
-                    transition_data = json.loads(transition_response)
-                    original_data = json.loads(st.session_state["chart_response"])
+                    transition_data = orjson.loads(transition_response)
+                    original_data = orjson.loads(st.session_state["chart_response"])
                     
                     # Filter data to start from the transition year
                     transition_index = transition_year - 1
@@ -521,6 +681,8 @@ def main():
                     filtered_original_net_worth = original_data["data"]["netWorth"][transition_index:]
                     filtered_transition_net_worth = transition_data["data"]["netWorth"][transition_index:]
                     
+                    import plotly.graph_objs as go
+
                     fig = go.Figure()
                     
                     # Original path
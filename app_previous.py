@@ -1,119 +1,306 @@
-import json
+import atexit
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import orjson
 import os
 import anthropic
 import re
+import string
 import pandas as pd
 import streamlit as st
+import threading
+import time
 from dotenv import load_dotenv
-import plotly.graph_objs as go
-import streamlit.components.v1 as components
-import statistics
 
+# (question, variable name, widget) for each personalisation step
+_ADDITIONAL = [
+    ("Do you have a pet? If yes, what kind?", "pet", st.text_input),
+    ("What is your favorite subject?", "subject", st.text_input),
+    ("What is your main goal in life?", "goal", st.text_input),
+    ("Do you like money?", "like_money", st.checkbox),
+    ("Do you like cars?", "like_cars", st.checkbox),
+    ("Do you admire any singer? If yes, who?", "admire_singer", st.text_input)
+]
+
+@st.cache_data(show_spinner=False)
 def load_data():
-    df_edu = pd.read_csv('california_colleges.csv')
-    df_occ = pd.read_csv('msa_occ_wage_only_3columns.csv')
-    
-    df_edu['INSTNM'] = df_edu['INSTNM'].str.strip()
-    df_edu['CIPDESC'] = df_edu['CIPDESC'].str.strip()
-    
-    return df_edu, df_occ
+    # Built from the CSVs by convert_to_parquet.py: already stripped, categorical
+    # and with A_MEAN numeric, so there is nothing left to parse or clean here
+    df_edu = pd.read_parquet('california_colleges.parquet', columns=['INSTNM', 'CIPDESC'])
+    df_occ = pd.read_parquet(
+        'msa_occ_wage_only_3columns.parquet',
+        columns=['AREA_TITLE', 'OCC_TITLE', 'A_MEAN']
+    )
+
+    # Lookup tables so widget changes are dict hits instead of full-frame masks.
+    # Plain tuples, since each Categorical from unique() drags every category along
+    # when cache_data copies the result
+    inst_to_fields = {
+        inst: tuple(fields)
+        for inst, fields in df_edu.groupby('INSTNM', sort=False, observed=True)['CIPDESC'].unique().items()
+    }
+    area_to_occ = {
+        area: tuple(occs)
+        for area, occs in df_occ.groupby('AREA_TITLE', sort=False, observed=True)['OCC_TITLE'].unique().items()
+    }
 
-def query_claude_3_5(prompt, api_key):
+    # Sorted once here so the selectbox options are stable and never rebuilt per rerun
+    institutions = tuple(sorted(inst_to_fields))
+    areas = tuple(sorted(area_to_occ))
+    salary_lookup = format_salary_series(
+        df_occ.drop_duplicates(['AREA_TITLE', 'OCC_TITLE'])
+        .set_index(['AREA_TITLE', 'OCC_TITLE'])['A_MEAN']
+    ).to_dict()
+
+    # main() only needs the lookups, and cache_data copies whatever is returned on
+    # every rerun, so the frames themselves stay inside the loader
+    return institutions, areas, inst_to_fields, area_to_occ, salary_lookup
+
+CLAUDE_MODEL = "claude-3-5-sonnet-20241022"
+
+@st.cache_resource
+def get_anthropic_client(api_key):
+    return anthropic.Anthropic(api_key=api_key)
+
+NUMBER_LIST = {"type": "array", "items": {"type": "number"}, "minItems": 15, "maxItems": 15}
+
+# Forcing this tool makes Claude return the chart as structured tool input,
+# so there is no text response to decode or repair
+PROJECTION_TOOL = {
+    "name": "emit_projection",
+    "description": "Record the 15-year financial projection used to draw the chart.",
+    "input_schema": {
+        "type": "object",
+        "properties": {
+            "data": {
+                "type": "object",
+                "properties": {
+                    "years": NUMBER_LIST,
+                    "netWorth": NUMBER_LIST,
+                    "income": NUMBER_LIST,
+                    "expenses": NUMBER_LIST,
+                    "loans": NUMBER_LIST
+                },
+                "required": ["years", "netWorth", "income", "expenses", "loans"]
+            },
+            "summary": {
+                "type": "object",
+                "properties": {
+                    "totalNetWorth": {"type": "number"},
+                    "peakNetWorth": {"type": "number"},
+                    "averageGrowth": {"type": "number"}
+                },
+                "required": ["totalNetWorth", "peakNetWorth", "averageGrowth"]
+            }
+        },
+        "required": ["data", "summary"]
+    }
+}
+
+def request_projection(client, prompt, model):
+    message = client.messages.create(
+        model=model,
+        max_tokens=800,
+        temperature=0.5,
+        tools=[PROJECTION_TOOL],
+        tool_choice={"type": "tool", "name": "emit_projection"},
+        messages=[{"role": "user", "content": prompt}]
+    )
+    return message.content[0].input
+
+@st.cache_data(show_spinner=False, ttl=3600, max_entries=256)
+def cached_claude_projection(prompt, model, _api_key):
+    return request_projection(get_anthropic_client(_api_key), prompt, model)
+
+def query_claude_projection(prompt, api_key):
     try:
-        client = anthropic.Anthropic(api_key=api_key)
-        message = client.messages.create(
-            model="claude-3-5-sonnet-20241022",
-            max_tokens=1000,
-            temperature=0.5,
-            messages=[{"role": "user", "content": prompt}]
-        )
-        return message.content[0].text
+        return cached_claude_projection(prompt, CLAUDE_MODEL, api_key)
     except Exception as e:
         st.error(f"API call failed: {e}")
         return None
 
-def format_salary(salary):
+# Output budget per preference, so answering more questions never truncates the batch
+REVISION_TOKENS = 1200
+
+def revisions_tool(count):
+    """Forced tool whose input is exactly one revision per preference"""
+    return {
+        "name": "emit_revisions",
+        "description": "Record one revised projection per preference, in the order given.",
+        "input_schema": {
+            "type": "object",
+            "properties": {
+                "revisions": {
+                    "type": "array",
+                    "minItems": count,
+                    "maxItems": count,
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "revisedExplanation": {"type": "string"},
+                            "comparison": {"type": "string"}
+                        },
+                        "required": ["revisedExplanation", "comparison"]
+                    }
+                }
+            },
+            "required": ["revisions"]
+        }
+    }
+
+# Keyed on prompt, model and count; the leading underscore keeps the API key out of the hash.
+# Failed or truncated calls raise, so errors are never cached.
+@st.cache_data(show_spinner=False, ttl=3600, max_entries=256)
+def cached_claude_revisions(prompt, model, count, _api_key):
+    client = get_anthropic_client(_api_key)
+    message = client.messages.create(
+        model=model,
+        max_tokens=REVISION_TOKENS * count,
+        temperature=0.5,
+        tools=[revisions_tool(count)],
+        tool_choice={"type": "tool", "name": "emit_revisions"},
+        messages=[{"role": "user", "content": prompt}]
+    )
+    if message.stop_reason == "max_tokens":
+        raise ValueError(f"revisions were cut off at {REVISION_TOKENS * count} tokens")
+    return message.content[0].input["revisions"]
+
+def query_claude_revisions(prompt, model, count, api_key):
     try:
-        return "${:,.2f}".format(float(salary))
-    except (ValueError, TypeError):
-        return "N/A"
+        return cached_claude_revisions(prompt, model, count, api_key)
+    except Exception as e:
+        st.error(f"API call failed: {e}")
+        return None
 
-def save_output_to_file(output, filename="output.txt"):
-    if not output:
-        print("No output to save.")
-        return
-        
-    with open(filename, "a") as file:
-        file.write(output + "\n")
+def record_preference(var_name, question):
+    """Keep an answer only once the user has actually changed its widget"""
+    st.session_state.setdefault("preferences", {})[var_name] = (
+        question, st.session_state[f"pref_{var_name}"]
+    )
 
-def main():
-    st.title("15 Year Net Worth Projection")
-    load_dotenv()
-    api_key = os.getenv("ANTHROPIC_API_KEY", "")
+# Runs calls ahead of the click that needs them. The pool is shared by every session,
+# and its workers have no ScriptRunContext, so they only ever get plain client calls
+@st.cache_resource
+def get_prefetch_pool():
+    return ThreadPoolExecutor(max_workers=4)
 
-    df_edu, df_occ = load_data()
-    
-    # Only Claude 3.5 in this model selection, but keep design
-    llm_models = {
-        "Claude 3.5": "claude-3.5"
-    }
-    
-    col1, col2, col3 = st.columns([1,2,2])
-    
-    with col1:
-        selected_model = st.selectbox("Select LLM Model", list(llm_models.keys()))
-    
-    with col2:
-        institution = st.selectbox("Select Institution", df_edu['INSTNM'].unique())
-        fields = df_edu[df_edu['INSTNM'] == institution]['CIPDESC'].unique()
-        field = st.selectbox("Select Field of Study", fields)
+PREFETCH_TIMEOUT = 60
 
-    with col3:
-        area = st.selectbox("Select Geographic Area", df_occ['AREA_TITLE'].unique())
-        occupations = df_occ[df_occ['AREA_TITLE'] == area]['OCC_TITLE'].unique()
-        occupation = st.selectbox("Select Occupation", occupations)
-    
-    zipcode = st.text_input("Enter your current ZIP code")
-    house = st.number_input('Do you plan to live alone? How many bedrooms?', min_value=1, step=1)
-    
+def take_prefetch(prompt):
+    """Return the prefetched result for this prompt, or None if there isn't a usable one"""
+    prefetch = st.session_state.pop("_chart_prefetch", None)
+    if prefetch is None or prefetch[0] != prompt:
+        return None
     try:
-        salary_info = df_occ[
-            (df_occ['AREA_TITLE'] == area) & 
-            (df_occ['OCC_TITLE'] == occupation)
-        ]['A_MEAN'].iloc[0]
-        formatted_salary = format_salary(salary_info)
-    except IndexError:
-        formatted_salary = "N/A"
-    
-    if "explanation_response" not in st.session_state:
-        st.session_state["explanation_response"] = ""
+        return prefetch[1].result(timeout=PREFETCH_TIMEOUT)
+    except Exception as e:
+        prefetch[1].cancel()
+        st.warning(f"Prefetched chart unavailable, requesting it again: {e!r}")
+        return None
 
-    if "chart_response" not in st.session_state:
-        st.session_state["chart_response"] = ""
+# Streamed texts and prefetched charts can't go through st.cache_data, so they are kept here.
+# Bounded like cached_claude: entries expire after an hour, least recently used go first
+RESPONSE_CACHE_TTL = 3600
+RESPONSE_CACHE_SIZE = 256
+
+@st.cache_resource
+def get_response_cache():
+    return OrderedDict(), threading.Lock()
+
+def cache_get(key):
+    cache, lock = get_response_cache()
+    with lock:
+        entry = cache.get(key)
+        if entry is None:
+            return None
+        stored_at, value = entry
+        if time.monotonic() - stored_at > RESPONSE_CACHE_TTL:
+            del cache[key]
+            return None
+        cache.move_to_end(key)
+        return value
+
+def cache_put(key, value):
+    cache, lock = get_response_cache()
+    with lock:
+        cache[key] = (time.monotonic(), value)
+        cache.move_to_end(key)
+        while len(cache) > RESPONSE_CACHE_SIZE:
+            cache.popitem(last=False)
+
+def stream_claude(prompt, api_key, model=CLAUDE_MODEL):
+    cached = cache_get((prompt, model))
+    if cached is not None:
+        yield cached
+        return
+
+    client = get_anthropic_client(api_key)
+    with client.messages.stream(
+        model=model,
+        max_tokens=1000,
+        temperature=0.5,
+        messages=[{"role": "user", "content": prompt}]
+    ) as stream:
+        yield from stream.text_stream
+        cache_put((prompt, model), stream.get_final_message().content[0].text)
+
+def write_claude_stream(prompt, api_key, model=CLAUDE_MODEL):
+    """Render the completion as tokens arrive and return the full text"""
+    try:
+        return st.write_stream(stream_claude(prompt, api_key, model))
+    except Exception as e:
+        st.error(f"API call failed: {e}")
+        return None
+
+def inputs_fingerprint(*values):
+    return hashlib.blake2b(repr(values).encode(), digest_size=16).hexdigest()
+
+def format_salary_series(salaries):
+    return salaries.map("${:,.2f}".format, na_action='ignore').fillna("N/A")
 
-    explanation_prompt = f"""
+# One append handle per file for the whole process instead of reopening it per save.
+# Every session writes through it, so writes take the lock and are flushed right away
+@st.cache_resource
+def get_output_handle(filename):
+    handle = open(filename, "a")
+    atexit.register(handle.close)
+    return handle, threading.Lock()
+
+def save_output_to_file(output, filename="output.txt"):
+    if not output:
+        print("No output to save.")
+        return
+        
+    handle, lock = get_output_handle(filename)
+    with lock:
+        handle.write(output + "\n")
+        handle.flush()
+
+# Static prompt skeletons; only the $placeholders are filled in per click
+EXPLANATION_TMPL = string.Template("""
     Provide a detailed financial projection with these exact sections:
 
     1. EDUCATION COSTS
-    - Institution: {institution}
-    - Program: {field}
-    - Residency Status: [determine if {zipcode} is in-state or out-of-state for {institution}]
+    - Institution: $institution
+    - Program: $field
+    - Residency Status: [determine if $zipcode is in-state or out-of-state for $institution]
     - Annual tuition: [exact number]
     - Living costs during school: [exact number]
     - Total 4-year cost: [exact number]
 
     2. FINANCIAL AID
-    - Zipcode {zipcode} median household income: [exact number]
+    - Zipcode $zipcode median household income: [exact number]
     - Expected grants: [exact number]
     - Loan amount needed: [exact number]
     - Monthly loan payment: [exact number]
 
     3. CAREER PROJECTION
-    - Position: {occupation}
-    - Location: {area}
+    - Position: $occupation
+    - Location: $area
     - Starting salary: [exact number]
     - Expected annual raises: [percentage]
-    - Housing ({house} bedroom) monthly cost: [exact number]
+    - Housing ($house bedroom) monthly cost: [exact number]
 
     4. YEARLY BREAKDOWN
     Year 1-4 (School):
@@ -131,122 +318,263 @@ def main():
     Provide all numbers as plain numbers without currency symbols or commas.
     Do not include any explanatory text between sections.
     Each number should be a specific value, not a range.
-    """
+    """)
+
+# The chart and plan calls only need the yearly numbers, not the whole explanation
+_BREAKDOWN_RE = re.compile(r"YEARLY BREAKDOWN.*", re.S | re.I)
+
+def extract_breakdown(explanation):
+    """Return the YEARLY BREAKDOWN section, or the full explanation if it's missing"""
+    match = _BREAKDOWN_RE.search(explanation)
+    return match.group(0) if match else explanation
+
+CHART_TMPL = string.Template("""
+    Generate a financial projection as valid JSON with exactly this structure:
+    {
+        "data": {
+            "years": [1,2,3,4,5,6,7,8,9,10,11,12,13,14,15],
+            "netWorth": [list of 15 numbers],
+            "income": [list of 15 numbers],
+            "expenses": [list of 15 numbers],
+            "loans": [list of 15 numbers]
+        },
+        "summary": {
+            "totalNetWorth": number,
+            "peakNetWorth": number,
+            "averageGrowth": number
+        }
+    }
+
+    Rules:
+    - All numbers should be integers or decimals without commas
+    - First 4 years should show school expenses and loan accumulation
+    - Years 5-15 should show career income and expenses
+    - Use the following data for calculations:
+    $breakdown
+
+    Return only the JSON object, no additional text.
+    """)
+
+PLAN_TMPL = string.Template("""
+    Based on the current path, yearly breakdown and JSON chart below, provide 3 alternative plans for the user:
+    alternative college, field of study, career, and location recommended. Provide them in concise text.
+
+    Current path: $field at $institution, then $occupation in $area
+
+    Yearly breakdown:
+    $breakdown
+
+    JSON Chart:
+    $chart
+    """)
+
+ADDITIONAL_TMPL = string.Template("""
+    Considering each of the following personal preferences or interests separately:
+    $preference_list
+
+    Revise the 15-year net worth projection based on each preference.
+    Record one revision per preference, in the same order, with the emit_revisions tool.
+    Each revision has a revisedExplanation and a comparison of the original and revised explanation.
+
+    Original Explanation:
+    $explanation
+    """)
+
+# Tuples keep the arguments hashable, so identical chart data reuses the built figure
+@st.cache_data(show_spinner=False)
+def build_projection_fig(years, net_worth, income, expenses):
+    # Deferred so the landing page doesn't pay for importing plotly
+    import plotly.graph_objs as go
+
+    fig = go.Figure()
+
+    # Net Worth line
+    fig.add_trace(go.Scatter(
+        x=years,
+        y=net_worth,
+        name="Net Worth",
+        mode="lines+markers",
+        line=dict(color="green", width=3)
+    ))
+
+    # Income and Expenses bars
+    fig.add_trace(go.Bar(
+        x=years,
+        y=income,
+        name="Income",
+        marker_color="blue",
+        opacity=0.6
+    ))
+
+    fig.add_trace(go.Bar(
+        x=years,
+        y=expenses,
+        name="Expenses",
+        marker_color="red",
+        opacity=0.6
+    ))
+
+    fig.update_layout(
+        title="15-Year Financial Projection",
+        xaxis_title="Year",
+        yaxis_title="Amount ($)",
+        barmode="group",
+        template="plotly_white",
+        showlegend=True
+    )
+
+    return fig
+
+def main():
+    st.title("15 Year Net Worth Projection")
+    load_dotenv()
+    api_key = os.getenv("ANTHROPIC_API_KEY", "")
+
+    institutions, areas, inst_to_fields, area_to_occ, salary_lookup = load_data()
+    
+    # Only Claude 3.5 in this model selection, but keep design
+    llm_models = {
+        "Claude 3.5": CLAUDE_MODEL
+    }
+    
+    col1, col2, col3 = st.columns([1,2,2])
+    
+    with col1:
+        selected_model = st.selectbox("Select LLM Model", list(llm_models.keys()), key="model")
+    
+    with col2:
+        institution = st.selectbox("Select Institution", institutions, key="institution")
+
+    with col3:
+        area = st.selectbox("Select Geographic Area", areas, key="area")
+
+    # Field and occupation options depend on the two selections above, so those
+    # stay outside the form; the rest only rerun the script when submitted
+    with st.form("inputs"):
+        _, form_col2, form_col3 = st.columns([1,2,2])
+
+        with form_col2:
+            fields = inst_to_fields[institution]
+            field = st.selectbox("Select Field of Study", fields, key="field")
+
+        with form_col3:
+            occupations = area_to_occ[area]
+            occupation = st.selectbox("Select Occupation", occupations, key="occupation")
+
+        zipcode = st.text_input("Enter your current ZIP code", key="zipcode")
+        house = st.number_input('Do you plan to live alone? How many bedrooms?', min_value=1, step=1, key="house")
+        submitted = st.form_submit_button("Update")
+
+    if submitted:
+        st.session_state["inputs_submitted"] = True
+    if not st.session_state.get("inputs_submitted"):
+        return
+    
+    if "explanation_response" not in st.session_state:
+        st.session_state["explanation_response"] = ""
+
+    if "chart_response" not in st.session_state:
+        st.session_state["chart_response"] = ""
+
+    if "chart_data" not in st.session_state:
+        st.session_state["chart_data"] = None
+
+    explanation_prompt = EXPLANATION_TMPL.substitute(
+        institution=institution,
+        field=field,
+        zipcode=zipcode,
+        occupation=occupation,
+        area=area,
+        house=house
+    )
 
     if st.button("Get Explanation"):
         model_id = llm_models[selected_model]
-        explanation_response = query_claude_3_5(explanation_prompt, api_key)
+        explanation_response = write_claude_stream(explanation_prompt, api_key, model_id)
+        if explanation_response != st.session_state["explanation_response"]:
+            # The stored chart was built from the previous explanation
+            st.session_state["chart_key"] = None
+            st.session_state["chart_response"] = ""
+            st.session_state["chart_data"] = None
         st.session_state["explanation_response"] = explanation_response
-        st.write(explanation_response)
         save_output_to_file(explanation_response)
 
+        if explanation_response:
+            # Start the chart call now so it's usually finished by the time "Show Chart" is clicked,
+            # unless this explanation's chart is already stored or cached
+            chart_prompt = CHART_TMPL.substitute(breakdown=extract_breakdown(explanation_response))
+            already_have = (
+                inputs_fingerprint(chart_prompt) == st.session_state.get("chart_key")
+                or cache_get((chart_prompt, CLAUDE_MODEL)) is not None
+            )
+            if not already_have:
+                st.session_state["_chart_prefetch"] = (
+                    chart_prompt,
+                    get_prefetch_pool().submit(
+                        request_projection, get_anthropic_client(api_key), chart_prompt, CLAUDE_MODEL
+                    )
+                )
+
     if st.session_state["explanation_response"]:
-        chart_prompt = f"""
-        Generate a financial projection as valid JSON with exactly this structure:
-        {{
-            "data": {{
-                "years": [1,2,3,4,5,6,7,8,9,10,11,12,13,14,15],
-                "netWorth": [list of 15 numbers],
-                "income": [list of 15 numbers],
-                "expenses": [list of 15 numbers],
-                "loans": [list of 15 numbers]
-            }},
-            "summary": {{
-                "totalNetWorth": number,
-                "peakNetWorth": number,
-                "averageGrowth": number
-            }}
-        }}
-
-        Rules:
-        - All numbers should be integers or decimals without commas
-        - First 4 years should show school expenses and loan accumulation
-        - Years 5-15 should show career income and expenses
-        - Use the following data for calculations:
-        {st.session_state["explanation_response"]}
-
-        Return only the JSON object, no additional text.
-        """
+        breakdown = extract_breakdown(st.session_state["explanation_response"])
+        chart_prompt = CHART_TMPL.substitute(breakdown=breakdown)
 
         if st.button("Show Chart"):
-            chart_response = query_claude_3_5(chart_prompt, api_key)
-            st.session_state["chart_response"] = chart_response
-            
-            try:
-                data = json.loads(chart_response)
-                years = data["data"]["years"]
-                
-                fig = go.Figure()
-                
-                # Net Worth line
-                fig.add_trace(go.Scatter(
-                    x=years,
-                    y=data["data"]["netWorth"],
-                    name="Net Worth",
-                    mode="lines+markers",
-                    line=dict(color="green", width=3)
-                ))
-                
-                # Income and Expenses bars
-                fig.add_trace(go.Bar(
-                    x=years,
-                    y=data["data"]["income"],
-                    name="Income",
-                    marker_color="blue",
-                    opacity=0.6
-                ))
-                
-                fig.add_trace(go.Bar(
-                    x=years,
-                    y=data["data"]["expenses"],
-                    name="Expenses",
-                    marker_color="red",
-                    opacity=0.6
-                ))
-                
-                fig.update_layout(
-                    title="15-Year Financial Projection",
-                    xaxis_title="Year",
-                    yaxis_title="Amount ($)",
-                    barmode="group",
-                    template="plotly_white",
-                    showlegend=True
+            # Keyed on the prompt, which is built from the current explanation
+            chart_key = inputs_fingerprint(chart_prompt)
+            if chart_key == st.session_state.get("chart_key"):
+                data = st.session_state["chart_data"]
+            else:
+                data = (
+                    cache_get((chart_prompt, CLAUDE_MODEL))
+                    or take_prefetch(chart_prompt)
+                    or query_claude_projection(chart_prompt, api_key)
                 )
-                
-                st.plotly_chart(fig)
-                
-                # Display metrics
-                col1, col2, col3 = st.columns(3)
-                with col1:
-                    st.metric("Total Net Worth", f"${data['summary']['totalNetWorth']:,.0f}")
-                with col2:
-                    st.metric("Peak Net Worth", f"${data['summary']['peakNetWorth']:,.0f}")
-                with col3:
-                    st.metric("Average Growth", f"${data['summary']['averageGrowth']:,.0f}")
-            
-            except json.JSONDecodeError as e:
-                st.error(f"Invalid JSON format: {str(e)}")
-            except KeyError as e:
-                st.error(f"Missing required data: {str(e)}")
-            except Exception as e:
-                st.error(f"Error: {str(e)}")
 
-    if st.session_state["chart_response"]:
-        plan_prompt = f"""
-        Based on the explanation and the JSON chart below, provide 3 alternative plans for the user:
-        alternative college, field of study, career, and location recommended. Provide them in concise text.
-
-        Explanation:
-        {st.session_state["explanation_response"]}
+            if data:
+                try:
+                    fig = build_projection_fig(
+                        tuple(data["data"]["years"]),
+                        tuple(data["data"]["netWorth"]),
+                        tuple(data["data"]["income"]),
+                        tuple(data["data"]["expenses"])
+                    )
+                    st.plotly_chart(fig)
+
+                    # Only a chart that rendered is kept for reuse and the plan prompt
+                    st.session_state["chart_data"] = data
+                    st.session_state["chart_response"] = orjson.dumps(data).decode()
+                    st.session_state["chart_key"] = chart_key
+                    # Shared with later reruns and other sessions, prefetched or not
+                    cache_put((chart_prompt, CLAUDE_MODEL), data)
+
+                    # Display metrics
+                    col1, col2, col3 = st.columns(3)
+                    with col1:
+                        st.metric("Total Net Worth", f"${data['summary']['totalNetWorth']:,.0f}")
+                    with col2:
+                        st.metric("Peak Net Worth", f"${data['summary']['peakNetWorth']:,.0f}")
+                    with col3:
+                        st.metric("Average Growth", f"${data['summary']['averageGrowth']:,.0f}")
+
+                except KeyError as e:
+                    st.error(f"Missing required data: {str(e)}")
+                except Exception as e:
+                    st.error(f"Error: {str(e)}")
 
-        JSON Chart:
-        {st.session_state["chart_response"]}
-        """
+    if st.session_state["chart_response"]:
+        plan_prompt = PLAN_TMPL.substitute(
+            institution=institution,
+            field=field,
+            occupation=occupation,
+            area=area,
+            breakdown=extract_breakdown(st.session_state["explanation_response"]),
+            chart=st.session_state["chart_response"]
+        )
 
         if st.button("Generate Recommended Plans"):
             model_id = llm_models[selected_model]
-            plan_response = query_claude_3_5(plan_prompt, api_key)
-            st.write(plan_response)
+            plan_response = write_claude_stream(plan_prompt, api_key, model_id)
             save_output_to_file(plan_response)
 
     st.subheader(f"Salary Analysis (using {selected_model})")
@@ -254,43 +582,47 @@ def main():
     if "additional_step" not in st.session_state:
         st.session_state["additional_step"] = 0
 
-    additional_variables = [
-        ("Do you have a pet? If yes, what kind?", "pet"),
-        ("What is your favorite subject?", "subject"),
-        ("What is your main goal in life?", "goal"),
-        ("Do you like money?", "like_money"),
-        ("Do you like cars?", "like_cars"),
-        ("Do you admire any singer? If yes, who?", "admire_singer")
-    ]
+    if "preferences" not in st.session_state:
+        st.session_state["preferences"] = {}
 
     if st.button("Next Step"):
         st.session_state["additional_step"] += 1
 
     step = st.session_state["additional_step"]
-    if step > 0 and step <= len(additional_variables):
-        question, var_name = additional_variables[step - 1]
-        if var_name in ["like_money", "like_cars"]:
-            response = st.checkbox(question)
-        else:
-            response = st.text_input(question)
-
-        if st.button("Revise Projection"):
-            additional_prompt = f"""
-            Considering the following personal preference or interest:
-            - {question}: {response}
-            
-            Revise the 15-year net worth projection based on this new information.
-            Also include a comparison between the original and revised explanation in the same JSON keys:
-            "revisedExplanation" and "comparison".
-
-            Original Explanation:
-            {st.session_state["explanation_response"]}
-            """
+    if step > 0 and step <= len(_ADDITIONAL):
+        question, var_name, widget = _ADDITIONAL[step - 1]
+        # Widget defaults aren't answers, so only a changed value is recorded
+        widget(
+            question,
+            key=f"pref_{var_name}",
+            on_change=record_preference,
+            args=(var_name, question)
+        )
+
+        revise = st.button("Revise Projection")
+        if revise and not st.session_state["preferences"]:
+            st.warning("Answer at least one question before revising the projection.")
+        elif revise:
+            # Every answered preference goes into one request so the original
+            # explanation is sent once rather than once per question
+            preferences = list(st.session_state["preferences"].values())
+            preference_list = "\n".join(
+                f"{i}. {question}: {response}"
+                for i, (question, response) in enumerate(preferences, start=1)
+            )
+            additional_prompt = ADDITIONAL_TMPL.substitute(
+                preference_list=preference_list,
+                explanation=st.session_state["explanation_response"]
+            )
 
             model_id = llm_models[selected_model]
-            revised_response = query_claude_3_5(additional_prompt, api_key)
-            st.write(revised_response)
-            save_output_to_file(revised_response)
+            revisions = query_claude_revisions(additional_prompt, model_id, len(preferences), api_key)
+            if revisions:
+                for (question, response), revision in zip(preferences, revisions):
+                    st.subheader(f"{question} {response}")
+                    st.write(revision["revisedExplanation"])
+                    st.write(revision["comparison"])
+                save_output_to_file(orjson.dumps(revisions).decode())
             save_output_to_file(additional_prompt)
 
 if __name__ == "__main__":
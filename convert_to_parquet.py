@@ -0,0 +1,34 @@
+import pandas as pd
+
+# One-off conversion of the CSV sources into the Parquet files the apps load.
+# Rerun this after replacing either CSV.
+
+def convert_colleges(src='california_colleges.csv', dest='california_colleges.parquet'):
+    df_edu = pd.read_csv(
+        src,
+        usecols=['INSTNM', 'CIPDESC'],
+        dtype='string[pyarrow]',
+        engine='pyarrow'
+    )
+    for col in ('INSTNM', 'CIPDESC'):
+        df_edu[col] = df_edu[col].str.strip().astype('category')
+
+    df_edu.to_parquet(dest, compression='zstd', index=False)
+
+def convert_wages(src='msa_occ_wage_only_3columns.csv', dest='msa_occ_wage_only_3columns.parquet'):
+    df_occ = pd.read_csv(
+        src,
+        usecols=['AREA_TITLE', 'OCC_TITLE', 'A_MEAN'],
+        dtype={'AREA_TITLE': 'category', 'OCC_TITLE': 'category', 'A_MEAN': str},
+        engine='pyarrow'
+    )
+    # A_MEAN is stored as "100,690", with "*" or "#" where BLS suppresses the value
+    df_occ['A_MEAN'] = pd.to_numeric(
+        df_occ['A_MEAN'].str.replace(',', ''), errors='coerce', downcast='float'
+    )
+
+    df_occ.to_parquet(dest, compression='zstd', index=False)
+
+if __name__ == "__main__":
+    convert_colleges()
+    convert_wages()